@@ -1,27 +1,201 @@
-import os
-import json
+import re
+import asyncio
+import hashlib
 import logging
-from typing import TypedDict, Annotated, List, Dict, Any
+import functools
+import threading
+from collections import OrderedDict
+from typing import TypedDict, Annotated, List, Dict, Any, Iterable, Optional
 
-from langgraph.graph import StateGraph, END
+import orjson
+from cachetools import TTLCache
+from pydantic import BaseModel, Field
+from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
 from langgraph.checkpoint.memory import MemorySaver
+from langgraph.types import Send
 from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 
 # Assumed import from your project structure (the class we modified previously)
-from .llm_model_gemini import SQLQueryGenerator
+from .llm_model_gemini import SQLQueryGenerator, get_gemini_llm
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Schema search results keyed by vector store version and normalized search text.
+# Shared across agent instances; TTLCache is not thread-safe, hence the lock.
+_schema_search_cache = TTLCache(maxsize=1024, ttl=600)
+_schema_search_cache_lock = threading.Lock()
+
+def _schema_search_cache_key(search_text: str) -> tuple:
+    """Build the schema cache key; a rebuilt vector store has a new version, invalidating old entries"""
+    from db.vector_db_store import get_store_version
+
+    normalized = " ".join(search_text.lower().split())
+    return get_store_version(), hashlib.blake2b(normalized.encode()).hexdigest()
+
+# Phrasings of the schema lookup; searching several and merging improves recall
+SCHEMA_SEARCH_TEMPLATES = (
+    "Which columns in the database are relevant to the following question: {query}",
+    "Which tables contain the data needed to answer the following question: {query}",
+    "Column names and data types needed for the following question: {query}",
+)
+
+# Table references after FROM/JOIN, used to tag cached results for invalidation
+_TABLE_REF_RE = re.compile(r'\b(?:from|join)\s+("?[\w$]+"?(?:\s*\.\s*"?[\w$]+"?)*)', re.IGNORECASE)
+
+class QueryResultCache:
+    """Short-lived cache of executed SELECT results keyed on the normalized SQL text"""
+
+    def __init__(self, maxsize: int = 512, ttl: int = 60):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _signature(sql_query: str) -> str:
+        normalized = " ".join(sql_query.strip().rstrip(";").split())
+        return hashlib.sha1(normalized.encode()).hexdigest()
+
+    @staticmethod
+    def referenced_tables(sql_query: str) -> frozenset:
+        """Return referenced tables both schema-qualified and bare, lower-cased"""
+        tables = set()
+        for match in _TABLE_REF_RE.findall(sql_query):
+            name = re.sub(r'[\s"]', "", match).lower()
+            tables.update((name, name.rsplit(".", 1)[-1]))
+        return frozenset(tables)
+
+    def get(self, sql_query: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._cache.get(self._signature(sql_query))
+        return entry["result"] if entry else None
+
+    def put(self, sql_query: str, result: Dict[str, Any]) -> None:
+        entry = {"result": result, "tables": self.referenced_tables(sql_query)}
+        with self._lock:
+            self._cache[self._signature(sql_query)] = entry
+
+    def invalidate_tables(self, tables: Iterable[str]) -> None:
+        """Drop every cached result that reads from one of the given tables"""
+        tables = {table.lower() for table in tables}
+        with self._lock:
+            stale = [key for key, entry in self._cache.items() if entry["tables"] & tables]
+            for key in stale:
+                self._cache.pop(key, None)
+
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+def _to_json(obj: Any) -> str:
+    """Serialize to a JSON string with orjson, stringifying unsupported values (e.g. Decimal)"""
+    return orjson.dumps(obj, default=str, option=_ORJSON_OPTIONS).decode()
+
+def _summarize_rows(rows: List[Dict[str, Any]], sample_size: int = 5) -> Dict[str, Any]:
+    """
+    Describe tabular rows column-wise (dtype, distinct count, numeric range) plus a
+    few sample rows, which carries the same information as the raw JSON for far
+    fewer prompt tokens on wide or long results.
+    """
+    import pandas as pd
+
+    df = pd.DataFrame(rows)
+    columns = {}
+    for column in df.columns:
+        series = df[column]
+        try:
+            nunique = int(series.nunique())
+        except TypeError:  # unhashable cell values such as nested lists/dicts
+            nunique = None
+        summary = {"dtype": str(series.dtype), "nunique": nunique}
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            summary["min"] = float(series.min())
+            summary["max"] = float(series.max())
+        columns[str(column)] = summary
+
+    return {
+        "row_count": len(rows),
+        "columns": columns,
+        "sample_rows": rows[:sample_size]
+    }
+
+class BoundedMemorySaver(MemorySaver):
+    """
+    In-memory checkpointer that keeps at most max_threads conversation threads and
+    drops the least recently written one. A plain MemorySaver shared by a long-running
+    API process grows without bound. Its async methods delegate to put(), so
+    overriding put() covers ainvoke as well.
+    """
+
+    def __init__(self, max_threads: int = 256):
+        super().__init__()
+        self.max_threads = max_threads
+        self._thread_order = OrderedDict()
+        self._thread_order_lock = threading.Lock()
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        with self._thread_order_lock:
+            self._thread_order.pop(thread_id, None)
+            self._thread_order[thread_id] = None
+            evicted = []
+            while len(self._thread_order) > self.max_threads:
+                evicted.append(self._thread_order.popitem(last=False)[0])
+        for evicted_thread_id in evicted:
+            self.delete_thread(evicted_thread_id)
+        return super().put(config, checkpoint, metadata, new_versions)
+
+@functools.lru_cache(maxsize=256)
+def _build_schema_context(detailed_columns_str: str) -> str:
+    """Wrap the retrieved column definitions; memoized so retries reuse the same string"""
+    # The Global Map (schema names) is already part of the generator's cached static context
+    return f"""
+            DETAILED COLUMN DEFINITIONS (Relevant to this query):
+            {detailed_columns_str}
+            """
+
+def _take_latest(current: str, update: str) -> str:
+    """Reducer for fields that parallel nodes may write in the same step"""
+    return update
+
+# Response schemas enforced through Gemini's native JSON output mode
+class ChartSuggestion(BaseModel):
+    type: str = Field(description="Chart type, e.g. bar, line, pie, scatter")
+    title: str
+    x_axis: str = Field(description="Column name for the x axis")
+    y_axis: str = Field(description="Column name for the y axis")
+    reason: str
+    confidence: float = Field(description="Confidence between 0 and 1")
+
+class AutoChart(BaseModel):
+    type: str
+    title: str
+    x_axis: str
+    y_axis: str
+    reason: str
+
+class ChartAnalysisResult(BaseModel):
+    chartable: bool
+    reasoning: str
+    suggested_charts: List[ChartSuggestion]
+    auto_chart: AutoChart
+
+class StandaloneQuestion(BaseModel):
+    standalone_question: str = Field(description="The follow-up rewritten as a standalone question")
+
+def _append_history(current: str, update: str) -> str:
+    """Reducer that appends finished turns to the running chat history text"""
+    if not update:
+        return current
+    return f"{current}\n{update}" if current else update
+
 class SQLAgentState(TypedDict):
     """State structure for the SQL agent workflow"""
     user_question: str
     messages: Annotated[List[BaseMessage], add_messages]
+    # "User: ..."/"Assistant: ..." lines for completed turns, maintained incrementally
+    chat_history_text: Annotated[str, _append_history]
     schema_info: List[Dict[str, Any]]
+    # schema_info contents joined once by schema search, reused on SQL retries
+    detailed_columns_str: str
     # table_info removed as requested
     raw_sql_query: str
     cleaned_sql_query: str
@@ -29,19 +203,18 @@ class SQLAgentState(TypedDict):
     execution_result: str
     execution_data_json: str
     chart_analysis: Dict[str, Any]
-    error_message: str
-    current_step: str
+    error_message: Annotated[str, _take_latest]
+    current_step: Annotated[str, _take_latest]
     is_complete: bool
     retry_count: int
 
 class SQLLangGraphAgentGemini:
     def __init__(self, vector_store, join_details, schema_info, query_runner=None):
         self.vector_store = vector_store
-        # This uses the modified SQLQueryGenerator from the previous step
-        self.sql_generator = SQLQueryGenerator()
         self.join_details = join_details
         self.schema_info = schema_info 
         self.query_runner = query_runner
+        self.query_result_cache = QueryResultCache(maxsize=512, ttl=60)
         self.db_structure = """
         DATABASE STRUCTURE (Schema -> Tables):
         Schema : fl_lms
@@ -53,18 +226,39 @@ class SQLLangGraphAgentGemini:
         Schema : cdp
         contains tables : customerdataproductfinal
         """
+
+        # The database map and join details never change per request, so the
+        # generator caches them alongside its system prompt
+        self.sql_generator = SQLQueryGenerator(
+            static_context=f"{self.db_structure}\nJoin Details:\n{self.join_details}"
+        )
         
-        # Initialize the LLM for helper tasks (Rewriting, Chart Analysis)
-        # We ensure it uses the same environment variable and modern params
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
-            temperature=0.1,
-            max_output_tokens=2048,
-            google_api_key=os.getenv("GOOGLE_API_KEY")
+        # Shared LLM for helper tasks (Rewriting, Chart Analysis)
+        self.llm = get_gemini_llm(0.1)
+        # Prompt templates and chains are built once and reused for every request.
+        # Structured output makes Gemini return schema-conforming JSON directly.
+        self.rewriter_chain = ChatPromptTemplate.from_messages([
+            ("system", "Given the chat history and a follow-up question, rewrite the follow-up question to be a standalone question."),
+            ("human", "Chat History:\n{chat_history}\n\nFollow-up Question:\n{question}")
+        ]) | self.llm.with_structured_output(StandaloneQuestion, method="json_schema")
+
+        self.chart_prompt_template = ChatPromptTemplate.from_messages([
+            ("human", """You are a data visualization expert. Analyze if this data can be visualized.
+
+User Question:
+{question}
+
+Data Summary (per-column stats and sample rows):
+{data_sample}
+
+Suggest suitable charts using the column names above, and pick the best one as auto_chart.""")
+        ])
+        self.chart_chain = self.chart_prompt_template | self.llm.with_structured_output(
+            ChartAnalysisResult, method="json_schema"
         )
         
-        # Add checkpointer for persistence
-        self.checkpointer = MemorySaver()
+        # Add checkpointer for persistence (bounded, non-blocking in-memory storage)
+        self.checkpointer = BoundedMemorySaver(max_threads=256)
         
         # Build the workflow graph
         self.workflow = self._build_workflow()
@@ -82,19 +276,23 @@ class SQLLangGraphAgentGemini:
         workflow.add_node("chart_analysis", self._chart_analysis_node)
         workflow.add_node("error_handler", self._error_handler_node)
         
-        # Set entry point
-        workflow.set_entry_point("rewrite_question")
+        workflow.add_node("join_context", self._join_context_node)
         
-        # Add conditional edges
+        # Rewrite and schema search only need the incoming question, so fan out
+        # to both (rewrite only on follow-ups) and join once they have finished.
+        # Both run in the same step, so plain edges trigger the join once.
         workflow.add_conditional_edges(
-            "rewrite_question",
-            self._should_continue_after_rewrite,
-            {"continue": "schema_search", "error": "error_handler"}
+            START,
+            self._fan_out_context,
+            ["rewrite_question", "schema_search"]
         )
+        workflow.add_edge("rewrite_question", "join_context")
+        workflow.add_edge("schema_search", "join_context")
 
+        # Add conditional edges
         workflow.add_conditional_edges(
-            "schema_search",
-            self._should_continue_after_schema,
+            "join_context",
+            self._should_continue_after_context,
             {"continue": "sql_generation", "error": "error_handler"}
         )
         
@@ -122,38 +320,19 @@ class SQLLangGraphAgentGemini:
         
         return workflow.compile(checkpointer=self.checkpointer)
     
-    def _rewrite_question_node(self, state: SQLAgentState) -> Dict[str, Any]:
+    async def _rewrite_question_node(self, state: SQLAgentState) -> Dict[str, Any]:
         """Rewrite the user's question to be more specific based on chat history"""
         try:
-            if len(state['messages']) <= 1:
-                return {
-                    "user_question": state['user_question'],
-                    "current_step": "question_rewriting_skipped"
-                }
-
-            # Format chat history
-            chat_history_messages = []
-            for msg in state['messages'][:-1]:
-                if isinstance(msg, HumanMessage):
-                    chat_history_messages.append(f"User: {msg.content}")
-                elif isinstance(msg, AIMessage):
-                    chat_history_messages.append(f"Assistant: {msg.content}")
-            
-            chat_history_text = "\n".join(chat_history_messages)
+            # Only routed here for follow-ups; fresh sessions skip this node entirely
+            # Formatted history of the previous turns, kept up to date by the reducer
+            chat_history_text = state.get('chat_history_text', "")
 
-            rewrite_prompt = ChatPromptTemplate.from_messages([
-                ("system", "Given the chat history and a follow-up question, rewrite the follow-up question to be a standalone question."),
-                ("human", "Chat History:\n{chat_history}\n\nFollow-up Question:\n{question}\n\nStandalone Question:")
-            ])
-            
-            rewriter_chain = rewrite_prompt | self.llm
-            
-            rewritten_question_message = rewriter_chain.invoke({
+            rewrite_result = await self.rewriter_chain.ainvoke({
                 "chat_history": chat_history_text,
                 "question": state['user_question']
             })
             
-            rewritten_question = rewritten_question_message.content.strip()
+            rewritten_question = rewrite_result.standalone_question.strip()
             
             return {
                 "user_question": rewritten_question,
@@ -166,33 +345,56 @@ class SQLLangGraphAgentGemini:
                 "current_step": "question_rewriting_failed"
             }
 
-    def _schema_search_node(self, state: SQLAgentState) -> Dict[str, Any]:
+    async def _schema_search_node(self, state: SQLAgentState) -> Dict[str, Any]:
         """Search ONLY for relevant schema information (Table info logic removed)"""
         try:
-            full_query = f"User Question: {state['user_question']}"
+            # This runs alongside the rewrite step, so a follow-up question is paired
+            # with the previous user turn to keep enough context for retrieval
+            human_turns = [msg.content for msg in state['messages'] if isinstance(msg, HumanMessage)]
+            search_question = " ".join(human_turns[-2:]) if human_turns else state['user_question']
+            full_query = f"User Question: {search_question}"
 
-            # Search only for schema information
-            schema_results = self.vector_store.similarity_search_with_score(
-                f"Which columns in the database are relevant to the following question: {full_query}", 
-                k=5
-            )
-            
-            logger.info(f"Schema search results: {schema_results}")
-            
-            schema_info = []
-            for res in schema_results:
-                schema_info.append({
-                    "content": res[0].page_content,
-                    "score": float(res[1]),
-                    "metadata": res[0].metadata if hasattr(res[0], 'metadata') else {}
-                })
+            # The store version is re-read from the database now and then, so off the loop
+            cache_key = await asyncio.to_thread(_schema_search_cache_key, search_question)
+            with _schema_search_cache_lock:
+                schema_info = _schema_search_cache.get(cache_key)
+
+            if schema_info is None:
+                # Search only for schema information, one query per phrasing in parallel.
+                # The vector store client is synchronous, so each search runs on a thread.
+                result_lists = await asyncio.gather(*(
+                    asyncio.to_thread(
+                        self.vector_store.similarity_search_with_score,
+                        template.format(query=full_query),
+                        k=5
+                    )
+                    for template in SCHEMA_SEARCH_TEMPLATES
+                ))
+                schema_results = self._merge_search_results(result_lists, k=5)
+                
+                logger.info("Schema search results: %s", schema_results)
+                
+                schema_info = []
+                for res in schema_results:
+                    schema_info.append({
+                        "content": res[0].page_content,
+                        "score": float(res[1]),
+                        "metadata": res[0].metadata if hasattr(res[0], 'metadata') else {}
+                    })
+
+                with _schema_search_cache_lock:
+                    _schema_search_cache[cache_key] = schema_info
             
             # Removed table_info processing
+
+            # Merged results are unique per document, so a plain join suffices
+            detailed_columns_str = "\n".join(item["content"] for item in schema_info)
             
+            # error_message is left untouched so a parallel rewrite failure is kept
             return {
                 "schema_info": schema_info,
-                "current_step": "schema_search_complete",
-                "error_message": ""
+                "detailed_columns_str": detailed_columns_str,
+                "current_step": "schema_search_complete"
             }
             
         except Exception as e:
@@ -201,40 +403,43 @@ class SQLLangGraphAgentGemini:
                 "current_step": "schema_search_failed"
             }
     
-    def _sql_generation_node(self, state: SQLAgentState) -> Dict[str, Any]:
+    def _merge_search_results(self, result_lists, k: int = 5) -> List[tuple]:
+        """Merge (document, distance) lists, keeping each document's best (lowest) distance"""
+        best = {}
+        for results in result_lists:
+            for doc, score in results:
+                current = best.get(doc.page_content)
+                if current is None or score < current[1]:
+                    best[doc.page_content] = (doc, score)
+        return sorted(best.values(), key=lambda res: res[1])[:k]
+
+    def _join_context_node(self, state: SQLAgentState) -> Dict[str, Any]:
+        """Fan-in point once question rewriting and schema search have both finished"""
+        return {}
+
+    async def _sql_generation_node(self, state: SQLAgentState) -> Dict[str, Any]:
         """Generate SQL query based on schema information"""
         try:
-            # Format chat history
-            chat_history_messages = []
-            for msg in state['messages'][:-1]:
-                if isinstance(msg, HumanMessage):
-                    chat_history_messages.append(f"User: {msg.content}")
-                elif isinstance(msg, AIMessage):
-                    chat_history_messages.append(f"Assistant: {msg.content}")
-            
-            chat_history_text = "\n".join(chat_history_messages)
-            
-            full_query = f"{chat_history_text}\n\nUser Question: {state['user_question']}" if chat_history_text else f"User Question: {state['user_question']}"
+            # The rewrite step already folded chat history into a standalone question,
+            # so history is not prepended here; that keeps the prompt prefix stable
 
-            # 1. Get detailed column definitions from vector search (dynamic)
-            detailed_columns = [item["content"] for item in state["schema_info"]]
-            detailed_columns_str = "\n".join(detailed_columns)
-            
-            # 2. Combine the Global Map + Detailed Columns
-            # This ensures the LLM knows the Schema Name (from map) AND Column Names (from vector store)
-            combined_schema_context = f"""
-            {self.db_structure}
+            # 1. Detailed column definitions, joined once by the schema search node
+            # 2. Wrap them (memoized, so the retry path reuses the same string)
+            combined_schema_context = _build_schema_context(state["detailed_columns_str"])
+            
+            # On a retry after a failed execution, only the failed attempt is added;
+            # the rest of the prompt stays byte-identical so the prefix cache still hits
+            previous_attempt = ""
+            if state.get("error_message") and state.get("raw_sql_query"):
+                failed_sql = state.get("cleaned_sql_query") or state["raw_sql_query"]
+                previous_attempt = f"SQL: {failed_sql}\nError: {state['error_message']}"
 
-            DETAILED COLUMN DEFINITIONS (Relevant to this query):
-            {detailed_columns_str}
-            """
-            
             # 3. Pass the COMBINED string to the generator
-            raw_query = self.sql_generator.generate_sql_query(
-                user_request=full_query,
+            raw_query = await self.sql_generator.generate_sql_query(
+                user_request=state['user_question'],
                 schema_info=combined_schema_context,  # <--- Pass the combined string here
-                join_details=self.join_details,
-                database_type="Redshift"
+                database_type="Redshift",
+                previous_attempt=previous_attempt
             )
             
             if raw_query is None:
@@ -275,12 +480,16 @@ class SQLLangGraphAgentGemini:
                 "has_syntax_errors": False
             }
             
-            return {
+            update = {
                 "cleaned_sql_query": cleaned_query,
                 "validation_result": validation_result,
                 "current_step": "query_validation_complete",
                 "error_message": ""
             }
+            if not (validation_result["is_safe"] and self.query_runner):
+                # The turn ends here without a reply, so record only the question
+                update["chat_history_text"] = self._history_turn(state)
+            return update
             
         except Exception as e:
             return {
@@ -288,46 +497,65 @@ class SQLLangGraphAgentGemini:
                 "current_step": "query_validation_failed"
             }
     
-    def _query_execution_node(self, state: SQLAgentState) -> Dict[str, Any]:
+    async def _query_execution_node(self, state: SQLAgentState) -> Dict[str, Any]:
         """Execute the validated SQL query and return JSON formatted result"""
         try:
             if not self.query_runner:
                 return {
                     "execution_result": "Query execution skipped - no query runner configured",
-                    "execution_data_json": json.dumps({"error": "No query runner configured"}),
+                    "execution_data_json": _to_json({"error": "No query runner configured"}),
                     "current_step": "execution_skipped",
                     "is_complete": True
                 }
             
-            result = self.query_runner.run(state["cleaned_sql_query"])
+            sql_query = state["cleaned_sql_query"]
+            cached_result = self.query_result_cache.get(sql_query)
+            if cached_result is not None:
+                return {
+                    **cached_result,
+                    "current_step": "execution_complete",
+                    "is_complete": False, # Continue to chart analysis
+                    "error_message": ""
+                }
+
+            # The Redshift driver is blocking; keep it off the event loop
+            result = await asyncio.to_thread(self.query_runner.run, sql_query)
             
             execution_data_json = ""
             execution_result = ""
+            cacheable = True
             
             if result is not None:
                 try:
-                    # Handle Pandas DataFrame (expected from query_runner)
-                    if hasattr(result, 'to_dict'):
-                        records = result.to_dict(orient='records')
-                        execution_data_json = json.dumps(records, default=str)
+                    # Handle Pandas DataFrame (expected from query_runner); serialized in
+                    # pandas' C writer without materializing per-row dicts first
+                    if hasattr(result, 'to_json'):
+                        execution_data_json = result.to_json(orient='records', date_format='iso', default_handler=str)
                         execution_result = f"Query returned {len(result)} rows"
                     # Handle list of dicts
                     elif isinstance(result, list):
-                        execution_data_json = json.dumps(result, default=str)
+                        execution_data_json = _to_json(result)
                         execution_result = f"Query returned {len(result)} rows"
                     # Handle single dict
                     elif isinstance(result, dict):
-                        execution_data_json = json.dumps([result], default=str)
+                        execution_data_json = _to_json([result])
                         execution_result = "Query returned 1 row"
                     else:
                         raise ValueError("Query runner must return DataFrame, list[dict], or dict")
                 except Exception as json_error:
-                    logger.error(f"JSON conversion error: {json_error}")
-                    execution_data_json = json.dumps({"error": f"Could not convert to JSON: {str(json_error)}"})
+                    logger.error("JSON conversion error: %s", json_error)
+                    execution_data_json = _to_json({"error": f"Could not convert to JSON: {str(json_error)}"})
                     execution_result = f"Error: {str(json_error)}"
+                    cacheable = False
             else:
-                execution_data_json = json.dumps([])
+                execution_data_json = _to_json([])
                 execution_result = "No data returned"
+
+            if cacheable:
+                self.query_result_cache.put(sql_query, {
+                    "execution_result": execution_result,
+                    "execution_data_json": execution_data_json
+                })
             
             return {
                 "execution_result": execution_result,
@@ -344,7 +572,7 @@ class SQLLangGraphAgentGemini:
                 "retry_count": state.get("retry_count", 0) + 1
             }
 
-    def _chart_analysis_node(self, state: SQLAgentState) -> Dict[str, Any]:
+    async def _chart_analysis_node(self, state: SQLAgentState) -> Dict[str, Any]:
         """Analyze data for chart visualization using LLM"""
         try:
             data_result = state.get("execution_data_json", "")
@@ -352,12 +580,13 @@ class SQLLangGraphAgentGemini:
             
             # Validate JSON structure
             try:
-                parsed_data = json.loads(data_result)
+                parsed_data = orjson.loads(data_result)
             except Exception:
                 parsed_data = []
             
             # Check if data is structured and non-empty
             if not isinstance(parsed_data, list) or len(parsed_data) == 0:
+                response_msg_text = "Query executed successfully.\n\nResult: No data returned."
                 return {
                     "chart_analysis": {
                         "chartable": False,
@@ -365,59 +594,21 @@ class SQLLangGraphAgentGemini:
                         "suggested_charts": [],
                         "auto_chart": {"type": "", "title": "", "reason": "No valid data"}
                     },
-                    "messages": [AIMessage(content=f"Query executed successfully.\n\nResult: No data returned.")],
+                    "messages": [AIMessage(content=response_msg_text)],
+                    "chat_history_text": self._history_turn(state, response_msg_text),
                     "current_step": "chart_analysis_complete",
                     "is_complete": True
                 }
             
-            # Truncate data for token limit
-            data_sample = str(data_result)[:2000] if len(str(data_result)) > 2000 else str(data_result)
+            # Columnar summary + a few rows instead of a truncated slice of raw JSON
+            data_sample = _to_json(_summarize_rows(parsed_data))
             
-            chart_analysis_prompt = f"""You are a data visualization expert. Analyze if this data can be visualized.
-
-User Question:
-{question}
-
-Data Sample:
-{data_sample}
-
-Respond with ONLY valid JSON in this exact structure (no markdown, no code blocks):
-{{{{
-  "chartable": true,
-  "reasoning": "Explanation",
-  "suggested_charts": [
-    {{{{
-      "type": "bar",
-      "title": "Chart Title",
-      "x_axis": "column_name",
-      "y_axis": "column_name",
-      "reason": "Why this fits",
-      "confidence": 0.85
-    }}}}
-  ],
-  "auto_chart": {{{{
-    "type": "bar",
-    "title": "Best Chart",
-    "x_axis": "column_name",
-    "y_axis": "column_name",
-    "reason": "Why best"
-  }}}}
-}}}}"""
-
-            # Invoke LLM directly without ChatPromptTemplate
-            chart_response_message = self.llm.invoke([HumanMessage(content=chart_analysis_prompt)])
-            chart_response = chart_response_message.content.strip().replace('``````', '')
-            
-            try:
-                chart_analysis = json.loads(chart_response)
-            except (json.JSONDecodeError, ValueError):
-                # Fallback if JSON fails
-                chart_analysis = {
-                    'chartable': False,
-                    'suggested_charts': [],
-                    'auto_chart': {'type': '', 'title': '', 'reason': 'Parsing failed'},
-                    'reasoning': 'LLM response parsing failed.'
-                }
+            # The response schema is enforced by Gemini, so no fence stripping or JSON recovery
+            chart_result = await self.chart_chain.ainvoke({
+                "question": question,
+                "data_sample": data_sample
+            })
+            chart_analysis = chart_result.model_dump()
 
             response_msg_text = (
                 f"Query executed successfully.\n\n"
@@ -429,6 +620,7 @@ Respond with ONLY valid JSON in this exact structure (no markdown, no code block
             return {
                 "chart_analysis": chart_analysis,
                 "messages": [AIMessage(content=response_msg_text)],
+                "chat_history_text": self._history_turn(state, response_msg_text),
                 "current_step": "chart_analysis_complete",
                 "is_complete": True,
                 "error_message": ""
@@ -438,6 +630,7 @@ Respond with ONLY valid JSON in this exact structure (no markdown, no code block
             return {
                 "chart_analysis": {'chartable': False, 'reasoning': f"Error: {e}"},
                 "messages": [AIMessage(content="Query executed, but chart analysis failed.")],
+                "chat_history_text": self._history_turn(state, "Query executed, but chart analysis failed."),
                 "current_step": "chart_analysis_failed",
                 "is_complete": True,
                 "error_message": ""
@@ -448,17 +641,33 @@ Respond with ONLY valid JSON in this exact structure (no markdown, no code block
         error_msg = state.get('error_message', 'Unknown error')
         return {
             "messages": [AIMessage(content=f"Error: {error_msg}")],
+            "chat_history_text": self._history_turn(state, f"Error: {error_msg}"),
             "execution_result": error_msg,
-            "execution_data_json": json.dumps({"error": error_msg}),
+            "execution_data_json": _to_json({"error": error_msg}),
             "current_step": "error_handled",
             "is_complete": True
         }
     
+    def _history_turn(self, state: SQLAgentState, reply: str = "") -> str:
+        """Format the current turn's question and reply as chat history lines"""
+        question = next(
+            (msg.content for msg in reversed(state['messages']) if isinstance(msg, HumanMessage)),
+            state['user_question']
+        )
+        return self._format_turn(question, reply)
+
+    @staticmethod
+    def _format_turn(question: str, reply: str = "") -> str:
+        return f"User: {question}\nAssistant: {reply}" if reply else f"User: {question}"
+
     # Conditional logic
-    def _should_continue_after_rewrite(self, state: SQLAgentState) -> str:
-        return "error" if state.get("error_message") else "continue"
+    def _fan_out_context(self, state: SQLAgentState) -> List[Send]:
+        sends = [Send("schema_search", state)]
+        if len(state["messages"]) > 1:
+            sends.append(Send("rewrite_question", state))
+        return sends
 
-    def _should_continue_after_schema(self, state: SQLAgentState) -> str:
+    def _should_continue_after_context(self, state: SQLAgentState) -> str:
         return "error" if state.get("error_message") else "continue"
     
     def _should_continue_after_generation(self, state: SQLAgentState) -> str:
@@ -476,12 +685,14 @@ Respond with ONLY valid JSON in this exact structure (no markdown, no code block
             else: return "error"
         return "continue"
     
-    def process_query(self, user_question: str, thread_id: str = "default") -> Dict[str, Any]:
+    async def process_query(self, user_question: str, thread_id: str = "default") -> Dict[str, Any]:
         """Process a user query"""
         initial_state = SQLAgentState(
             user_question=user_question,
             messages=[HumanMessage(content=user_question)],
+            chat_history_text="",
             schema_info=[],
+            detailed_columns_str="",
             # table_info removed
             raw_sql_query="",
             cleaned_sql_query="",
@@ -498,10 +709,41 @@ Respond with ONLY valid JSON in this exact structure (no markdown, no code block
         config = {"configurable": {"thread_id": thread_id}}
         
         try:
-            final_state = self.workflow.invoke(initial_state, config)
+            final_state = await self.workflow.ainvoke(initial_state, config)
             return self._format_response(final_state)
         except Exception as e:
             return {"success": False, "error": str(e)}
+
+    async def has_history(self, thread_id: str = "default") -> bool:
+        """Whether the thread has earlier turns that a new question may follow up on"""
+        snapshot = await self.workflow.aget_state({"configurable": {"thread_id": thread_id}})
+        return bool(snapshot.values.get("messages"))
+
+    async def record_turn(self, user_question: str, result: Dict[str, Any], thread_id: str = "default") -> None:
+        """
+        Write a turn answered without running the graph (e.g. from a response cache)
+        into the thread's checkpoint, so later follow-ups are rewritten against it.
+        """
+        reply = result.get("assistant_message", "")
+        messages = [HumanMessage(content=user_question)]
+        if reply:
+            messages.append(AIMessage(content=reply))
+        await self.workflow.aupdate_state(
+            {"configurable": {"thread_id": thread_id}},
+            {
+                "user_question": result.get("user_question", user_question),
+                "messages": messages,
+                "chat_history_text": self._format_turn(user_question, reply),
+                "cleaned_sql_query": result.get("cleaned_sql_query", ""),
+                "execution_data_json": result.get("execution_data_json", ""),
+                "chart_analysis": result.get("chart_analysis", {}),
+                "error_message": "",
+                "current_step": "chart_analysis_complete",
+                "is_complete": True
+            },
+            # Recorded as the graph's last node, so the next question starts from START
+            as_node="chart_analysis"
+        )
     
     def _format_response(self, state: SQLAgentState) -> Dict[str, Any]:
         """Format final response"""
@@ -509,12 +751,14 @@ Respond with ONLY valid JSON in this exact structure (no markdown, no code block
             return {
                 "success": False,
                 "error": state["error_message"],
-                "execution_data_json": state.get("execution_data_json", json.dumps({"error": state["error_message"]}))
+                "execution_data_json": state.get("execution_data_json", _to_json({"error": state["error_message"]}))
             }
         
+        last_message = state["messages"][-1] if state.get("messages") else None
         return {
             "success": True,
             "user_question": state["user_question"],
+            "assistant_message": last_message.content if isinstance(last_message, AIMessage) else "",
             "cleaned_sql_query": state.get("cleaned_sql_query", ""),
             "execution_data_json": state.get("execution_data_json", ""),
             "chart_analysis": state.get("chart_analysis", {}),
@@ -1,5 +1,10 @@
 import os
+import re
+import asyncio
+import time
 import logging
+import functools
+from typing import Optional
 from dotenv import load_dotenv
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import SystemMessage, HumanMessage
@@ -7,29 +12,55 @@ from langchain_core.messages import SystemMessage, HumanMessage
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Markdown code fences (```sql / ```json ... ```) wrapped around model output
+_FENCE_RE = re.compile(r"^```(?:sql|json)?\s*|\s*```$", re.IGNORECASE)
+
+GEMINI_MODEL = "gemini-2.5-flash"
+# Lifetime of the explicit context cache holding the static prompt
+CONTEXT_CACHE_TTL_SECONDS = 3600
+# Wait before retrying after a failed cache creation, so one transient error
+# does not disable caching for a full TTL
+CONTEXT_CACHE_RETRY_SECONDS = 60
+
+SAFETY_SETTINGS = {
+    "HARM_CATEGORY_HARASSMENT": "BLOCK_NONE",
+    "HARM_CATEGORY_HATE_SPEECH": "BLOCK_NONE",
+    "HARM_CATEGORY_SEXUALLY_EXPLICIT": "BLOCK_NONE",
+    "HARM_CATEGORY_DANGEROUS_CONTENT": "BLOCK_NONE",
+}
+
+def _is_cache_missing(error) -> bool:
+    """
+    True when a request failed because its context cache no longer exists
+    (deleted, expired, or not found), as opposed to a transient 429/5xx.
+    """
+    message = str(error).lower()
+    return "not found" in message or "not_found" in message or "expired" in message
+
+@functools.lru_cache(maxsize=None)
+def get_gemini_llm(temperature: float = 0.0) -> ChatGoogleGenerativeAI:
+    """
+    Return the process-wide Gemini chat model for the given temperature, so agents
+    share one client (and its connection pool) instead of building their own.
+    """
+    return ChatGoogleGenerativeAI(
+        model=GEMINI_MODEL,
+        google_api_key=os.getenv("GOOGLE_API_KEY"),
+        temperature=temperature,
+        max_output_tokens=2048,
+        safety_settings=SAFETY_SETTINGS
+    )
+
 class SQLQueryGenerator:
-    def __init__(self):
+    def __init__(self, static_context: str = ""):
         self.api_key = os.getenv("GOOGLE_API_KEY")
         if not self.api_key:
             raise ValueError("GOOGLE_API_KEY not found in environment variables.")
         
-        # Initialize LangChain model with configuration
-        self.model = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
-            google_api_key=self.api_key,
-            temperature=0,  # Deterministic output for SQL
-            max_output_tokens=2048,
-            safety_settings={
-                "HARM_CATEGORY_HARASSMENT": "BLOCK_NONE",
-                "HARM_CATEGORY_HATE_SPEECH": "BLOCK_NONE",
-                "HARM_CATEGORY_SEXUALLY_EXPLICIT": "BLOCK_NONE",
-                "HARM_CATEGORY_DANGEROUS_CONTENT": "BLOCK_NONE",
-            }
-        )
+        # Shared LangChain model; temperature 0 for deterministic SQL
+        self.model = get_gemini_llm(0.0)
         
         # Base system prompt for SQL generation
         self.base_system_prompt = """You are an expert SQL query generator for Amazon Redshift, specialized in producing queries  for data visualization tools (charts, dashboards, and reports).
@@ -49,35 +80,121 @@ class SQLQueryGenerator:
                                     Do not include explanatory text, comments, markdown backticks, or formatting instructions.
                                     Return ONLY the raw SQL query unless a schema violation occurs."""
 
-    def generate_sql_query(self, user_request: str, schema_info: str = "", join_details: str = "", database_type: str = "Redshift") -> str:
+        # Request-invariant context (e.g. the database map) that is registered in a
+        # Gemini context cache together with the system prompt instead of being resent
+        self.static_context = static_context
+        self._cached_content_name = None
+        self._cached_content_expires_at = 0.0
+        # Serializes cache creation so a burst of first requests creates one cache, not one each
+        self._cache_lock = asyncio.Lock()
+
+    async def _get_cached_content(self) -> Optional[str]:
+        """
+        Return the name of the Gemini context cache holding the system prompt and
+        static context, creating it on first use and again once the TTL has lapsed.
+        Returns None when caching is unavailable so callers send the full prompt.
+        """
+        if not self.static_context:
+            return None
+        if time.monotonic() < self._cached_content_expires_at:
+            return self._cached_content_name
+
+        async with self._cache_lock:
+            # Another request may have refreshed the cache while we waited
+            if time.monotonic() < self._cached_content_expires_at:
+                return self._cached_content_name
+
+            from google import genai
+            from google.genai import types
+
+            client = genai.Client(api_key=self.api_key)
+            superseded_name = self._cached_content_name
+            try:
+                cached_content = await client.aio.caches.create(
+                    model=GEMINI_MODEL,
+                    config=types.CreateCachedContentConfig(
+                        system_instruction=self.base_system_prompt,
+                        contents=[self.static_context],
+                        ttl=f"{CONTEXT_CACHE_TTL_SECONDS}s",
+                    ),
+                )
+                self._cached_content_name = cached_content.name
+                # Refresh a minute early so requests never reference an expired cache
+                self._cached_content_expires_at = time.monotonic() + CONTEXT_CACHE_TTL_SECONDS - 60
+            except Exception as e:
+                # e.g. a transient 429/5xx, or the prompt is below Gemini's minimum cacheable size
+                logger.warning("Gemini context caching unavailable, sending full prompt: %s", e)
+                self._cached_content_name = None
+                self._cached_content_expires_at = time.monotonic() + CONTEXT_CACHE_RETRY_SECONDS
+
+            # Caches are billed until they expire, so drop the one this replaces
+            if superseded_name and superseded_name != self._cached_content_name:
+                try:
+                    await client.aio.caches.delete(name=superseded_name)
+                except Exception as e:
+                    logger.debug("Could not delete superseded context cache %s: %s", superseded_name, e)
+
+            return self._cached_content_name
+
+    async def generate_sql_query(self, user_request: str, schema_info: str = "", join_details: str = "", database_type: str = "Redshift", previous_attempt: str = "") -> str:
         """
         Generate SQL query based on user request and provided schema information.
+        previous_attempt (failed SQL + error) is appended as the last message on retries,
+        leaving everything before it identical to the first attempt.
         """
         try:
-            # Construct the user-specific context
+            # Construct the user-specific context. Invariant content (system prompt and
+            # static context) is sent first so repeated requests share a byte-identical
+            # prefix for Gemini's implicit prefix cache; the question always comes last.
+            join_context = f"""
+                                Join Details:
+                                {join_details}
+""" if join_details else ""
             user_context = f"""
                                 Database Type: {database_type}
 
                                 Schema Information:
                                 {schema_info}
-
-                                Join Details:
-                                {join_details}
-
+{join_context}
                                 User Question: 
                                 {user_request}
 
                                 Generate the appropriate SQL query:"""
-            # Create message payload
-            messages = [
-                SystemMessage(content=self.base_system_prompt),
-                HumanMessage(content=user_context)
-            ]
-
-            # Invoke the model
-            response = self.model.invoke(messages)
+            request_messages = [HumanMessage(content=user_context)]
+            if previous_attempt:
+                request_messages.append(HumanMessage(
+                    content=f"Previous attempt failed:\n{previous_attempt}\n\nReturn a corrected SQL query."
+                ))
+
+            response = None
+            cached_content = await self._get_cached_content()
+            if cached_content:
+                # System prompt and static context are served from the cache
+                try:
+                    response = await self.model.ainvoke(
+                        request_messages,
+                        cached_content=cached_content
+                    )
+                except Exception as e:
+                    # Only a missing/expired cache is fixed by resending the full prompt;
+                    # a transient 429/5xx would fail that call too, so it is raised as is
+                    if not _is_cache_missing(e):
+                        raise
+                    logger.warning("Context cache missing, retrying without cache: %s", e)
+                    if self._cached_content_name == cached_content:
+                        self._cached_content_expires_at = 0.0
+
+            if response is None:
+                # Create message payload
+                messages = [SystemMessage(content=self.base_system_prompt)]
+                if self.static_context:
+                    messages.append(HumanMessage(content=self.static_context))
+                messages.extend(request_messages)
+
+                # Invoke the model
+                response = await self.model.ainvoke(messages)
             
-            sql_query = response.content.strip().replace('``````', '').strip()
+            sql_query = _FENCE_RE.sub("", response.content.strip()).strip()
             
             if not sql_query:
                 logger.warning("Model returned an empty response for SQL generation.")
@@ -86,6 +203,6 @@ class SQLQueryGenerator:
             return sql_query
             
         except Exception as e:
-            logger.error(f"Error generating SQL: {e}")
+            logger.error("Error generating SQL: %s", e)
             return None
 
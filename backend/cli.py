@@ -4,13 +4,16 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from dotenv import load_dotenv
 from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
-import google.generativeai as genai
 import asyncio
-import json
+import csv
+import logging
+import threading
+import orjson
+from pathlib import Path
 
 # Adjust imports to be relative to the 'src' directory
 from agents.langgraph_agent import SQLLangGraphAgentGemini
-from db.vector_db_store import store_in_vector_db, get_vector_store
+from db.vector_db_store import astore_in_vector_db, get_vector_store
 from db.query_runner import RedshiftSQLTool
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_google_genai import ChatGoogleGenerativeAI
@@ -21,42 +24,92 @@ from db.table_descriptions_semantic import documents, join_details, schema_info
 # Load environment variables from .env file
 load_dotenv()
 
+# Logging is configured here, at the entrypoint, rather than in library modules
+logging.basicConfig(level=logging.INFO)
+
 # Configuration
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-genai.configure(api_key=GOOGLE_API_KEY)
+# Demo queries allowed in flight at once
+DEMO_CONCURRENCY = 3
+# Results with more rows than this are shown as a CSV preview instead of full JSON
+DISPLAY_ROW_THRESHOLD = 100
+DISPLAY_PREVIEW_ROWS = 50
+
+
+async def _ainput(prompt: str = "") -> str:
+    """
+    input() that doesn't block the event loop. The read happens on a daemon
+    thread, so a pending prompt never keeps the process alive on exit.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def deliver(setter, value):
+        if not future.done():
+            setter(value)
+
+    def read():
+        try:
+            outcome = (future.set_result, input(prompt))
+        except Exception as e:
+            outcome = (future.set_exception, e)
+        try:
+            loop.call_soon_threadsafe(deliver, *outcome)
+        except RuntimeError:
+            pass  # Loop already closed
+
+    threading.Thread(target=read, daemon=True).start()
+    return await future
 
 
 class Chatbot:
     def __init__(self):
         
-        # Initialize agent components once for efficiency
+        # Components are loaded by the async create() factory
         self.vector_store = None
         self.query_runner = None
         self.gemini_agent = None
-        self._init_agent_components()
+
+    @classmethod
+    async def create(cls):
+        """Create a chatbot and initialize its agent components once for efficiency"""
+        chatbot = cls()
+        await chatbot._init_agent_components()
+        return chatbot
     
-    def _init_agent_components(self):
+    async def _init_agent_components(self):
         """Initialize agent components once during chatbot creation"""
         print("Initializing Gemini SQL Agent components...")
+
+        # Configured when the chatbot starts rather than as an import side effect
+        if GOOGLE_API_KEY:
+            import google.generativeai as genai
+            genai.configure(api_key=GOOGLE_API_KEY)
         
-        # Load existing vector store
-        try:
-            self.vector_store = get_vector_store()
+        # Load existing vector store and initialize the query runner concurrently;
+        # both are independent blocking setup steps
+        vector_store, query_runner = await asyncio.gather(
+            asyncio.to_thread(get_vector_store),
+            asyncio.to_thread(RedshiftSQLTool),
+            return_exceptions=True
+        )
+        
+        if isinstance(vector_store, Exception):
+            print(f"✗ Error loading existing vector store: {vector_store}")
+            self.vector_store = None
+        else:
+            self.vector_store = vector_store
             if self.vector_store:
                 print("✓ Existing vector store loaded successfully.")
             else:
                 print("⚠ Warning: No existing vector store found.")
-        except Exception as e:
-            print(f"✗ Error loading existing vector store: {e}")
-            self.vector_store = None
         
-        # Initialize Query Runner
-        try:
-            self.query_runner = RedshiftSQLTool()
-            print("✓ Redshift query runner initialized.")
-        except Exception as e:
-            print(f"⚠ Could not initialize Redshift query runner: {e}")
+        if isinstance(query_runner, Exception):
+            print(f"⚠ Could not initialize Redshift query runner: {query_runner}")
             self.query_runner = None
+        else:
+            self.query_runner = query_runner
+            print("✓ Redshift query runner initialized.")
         
         # Initialize the Gemini Agent
         if self.vector_store:
@@ -84,7 +137,8 @@ class Chatbot:
             return self.vector_store
         
         try:
-            vector_store = get_vector_store()
+            # Blocking DB lookup; keep it off the event loop
+            vector_store = await asyncio.to_thread(get_vector_store)
             if vector_store:
                 print("Existing vector store loaded successfully.")
                 self.vector_store = vector_store
@@ -121,7 +175,7 @@ class Chatbot:
 
         try:
             # Process the user question with thread_id
-            result = self.gemini_agent.process_query(user_question, thread_id=thread_id)
+            result = await self.gemini_agent.process_query(user_question, thread_id=thread_id)
 
             # Display results
             self._display_results(result)
@@ -153,50 +207,93 @@ class Chatbot:
         print("-" * 60)
         json_data = result.get('execution_data_json', '{}')
         try:
-            # Pretty print JSON
-            parsed_json = json.loads(json_data)
-            print(json.dumps(parsed_json, indent=2))
+            # Pretty print JSON (orjson emits UTF-8 bytes, so write them to the raw buffer)
+            parsed_json = orjson.loads(json_data)
+            # Kept on the result so saving doesn't parse the same payload again
+            result['_parsed_data'] = parsed_json
+            if (isinstance(parsed_json, list) and len(parsed_json) > DISPLAY_ROW_THRESHOLD
+                    and isinstance(parsed_json[0], dict)):
+                self._write_table_preview(parsed_json)
+            else:
+                self._write_json(parsed_json)
             
             # Show record count
             if isinstance(parsed_json, list):
                 print(f"\n📈 Total Records: {len(parsed_json)}")
-        except json.JSONDecodeError:
+        except orjson.JSONDecodeError:
             print(json_data)
         print("-" * 60)
         
         # Display Chart Analysis
         chart_analysis = result.get('chart_analysis', {})
         if chart_analysis:
-            print(f"\n📊 Chart Analysis:")
-            print("-" * 60)
-            print(f"Chartable: {'✓ Yes' if chart_analysis.get('chartable') else '✗ No'}")
-            print(f"Reasoning: {chart_analysis.get('reasoning', 'N/A')}")
+            # Build the whole panel first and emit it with a single write
+            lines = [
+                "\n📊 Chart Analysis:",
+                "-" * 60,
+                f"Chartable: {'✓ Yes' if chart_analysis.get('chartable') else '✗ No'}",
+                f"Reasoning: {chart_analysis.get('reasoning', 'N/A')}",
+            ]
             
             if chart_analysis.get('chartable'):
                 # Display recommended chart
                 auto_chart = chart_analysis.get('auto_chart', {})
-                print(f"\n🎯 Recommended Chart:")
-                print(f"  Type: {auto_chart.get('type', 'N/A')}")
-                print(f"  Title: {auto_chart.get('title', 'N/A')}")
-                print(f"  X-axis: {auto_chart.get('x_axis', 'N/A')}")
-                print(f"  Y-axis: {auto_chart.get('y_axis', 'N/A')}")
-                print(f"  Reason: {auto_chart.get('reason', 'N/A')}")
+                lines += [
+                    "\n🎯 Recommended Chart:",
+                    f"  Type: {auto_chart.get('type', 'N/A')}",
+                    f"  Title: {auto_chart.get('title', 'N/A')}",
+                    f"  X-axis: {auto_chart.get('x_axis', 'N/A')}",
+                    f"  Y-axis: {auto_chart.get('y_axis', 'N/A')}",
+                    f"  Reason: {auto_chart.get('reason', 'N/A')}",
+                ]
                 
                 # Display alternative suggestions
                 suggested_charts = chart_analysis.get('suggested_charts', [])
                 if suggested_charts:
-                    print(f"\n💡 Alternative Chart Options:")
+                    lines.append("\n💡 Alternative Chart Options:")
                     for idx, chart in enumerate(suggested_charts, 1):
-                        print(f"  {idx}. {chart.get('type', 'N/A')} - {chart.get('title', 'N/A')}")
-                        print(f"     Confidence: {chart.get('confidence', 'N/A')}")
-            print("-" * 60)
+                        lines.append(f"  {idx}. {chart.get('type', 'N/A')} - {chart.get('title', 'N/A')}")
+                        lines.append(f"     Confidence: {chart.get('confidence', 'N/A')}")
+            lines.append("-" * 60)
+            sys.stdout.write("\n".join(lines) + "\n")
         
         print(f"\n{'='*60}\n")
     
-    def reinitialize_agent(self):
+    @staticmethod
+    def _write_json(parsed_json):
+        """
+        Write JSON to stdout. Row lists are streamed one record per line, so the
+        full pretty-printed document is never held in memory at once.
+        """
+        sys.stdout.flush()
+        out = sys.stdout.buffer
+        if isinstance(parsed_json, list) and parsed_json:
+            out.write(b"[\n")
+            last = len(parsed_json) - 1
+            for idx, row in enumerate(parsed_json):
+                out.write(b"  ")
+                out.write(orjson.dumps(row))
+                out.write(b",\n" if idx < last else b"\n")
+            out.write(b"]\n")
+        else:
+            out.write(orjson.dumps(parsed_json, option=orjson.OPT_INDENT_2))
+            out.write(b"\n")
+        out.flush()
+    
+    @staticmethod
+    def _write_table_preview(rows):
+        """Write the first rows of a large tabular result as compact CSV"""
+        writer = csv.DictWriter(
+            sys.stdout, fieldnames=list(rows[0].keys()), extrasaction="ignore", lineterminator="\n"
+        )
+        writer.writeheader()
+        writer.writerows(rows[:DISPLAY_PREVIEW_ROWS])
+        sys.stdout.write(f"... +{len(rows) - DISPLAY_PREVIEW_ROWS} more rows\n")
+    
+    async def reinitialize_agent(self):
         """Reinitialize the agent (useful if vector store is updated)"""
         print("Reinitializing agent components...")
-        self._init_agent_components()
+        await self._init_agent_components()
     
     def get_agent_status(self):
         """Get the initialization status of agent components"""
@@ -215,7 +312,7 @@ async def main():
     print("="*60 + "\n")
     
     # Initialize chatbot
-    chatbot = Chatbot()
+    chatbot = await Chatbot.create()
     
     # Check agent status
     status = chatbot.get_agent_status()
@@ -232,14 +329,20 @@ async def main():
         ]
         
         print("Running in DEMO mode with sample questions...\n")
-        for idx, question in enumerate(demo_questions, 1):
-            print(f"\n{'#'*60}")
-            print(f"DEMO QUERY {idx}/{len(demo_questions)}")
-            print(f"{'#'*60}")
-            await chatbot.get_response(question, thread_id=f"demo_thread_{idx}")
-            
-            if idx < len(demo_questions):
-                await asyncio.sleep(2)  # Pause between queries
+        # Queries overlap their Gemini/Redshift waits; the semaphore keeps us under rate limits
+        semaphore = asyncio.Semaphore(DEMO_CONCURRENCY)
+
+        async def run_demo_query(idx, question):
+            async with semaphore:
+                print(f"\n{'#'*60}")
+                print(f"DEMO QUERY {idx}/{len(demo_questions)}")
+                print(f"{'#'*60}")
+                return await chatbot.get_response(question, thread_id=f"demo_thread_{idx}")
+
+        await asyncio.gather(*(
+            run_demo_query(idx, question)
+            for idx, question in enumerate(demo_questions, 1)
+        ))
         
         print("\n✓ Demo completed!")
         return
@@ -257,7 +360,7 @@ async def main():
     
     while True:
         try:
-            user_input = input("\n🤔 You: ").strip()
+            user_input = (await _ainput("\n🤔 You: ")).strip()
             
             if not user_input:
                 continue
@@ -286,19 +389,22 @@ async def main():
             
             # Optionally save results to file
             if result.get('success') and result.get('chart_analysis', {}).get('chartable'):
-                save_option = input("\n💾 Save results to file? (y/n): ").strip().lower()
+                save_option = (await _ainput("\n💾 Save results to file? (y/n): ")).strip().lower()
                 if save_option == 'y':
                     filename = f"query_result_{thread_id}_{asyncio.get_event_loop().time():.0f}.json"
-                    with open(filename, 'w') as f:
-                        json.dump({
-                            'question': user_input,
-                            'sql_query': result.get('cleaned_sql_query'),
-                            'data': json.loads(result.get('execution_data_json', '{}')),
-                            'chart_analysis': result.get('chart_analysis')
-                        }, f, indent=2)
+                    payload = {
+                        'question': user_input,
+                        'sql_query': result.get('cleaned_sql_query'),
+                        'data': result.get('_parsed_data'),
+                        'chart_analysis': result.get('chart_analysis')
+                    }
+                    # Serialize and write off the event loop
+                    data_bytes = await asyncio.to_thread(orjson.dumps, payload, option=orjson.OPT_INDENT_2)
+                    await asyncio.to_thread(Path(filename).write_bytes, data_bytes)
                     print(f"✓ Results saved to: {filename}")
         
-        except KeyboardInterrupt:
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            # Ctrl+C arrives as a cancellation while awaiting input
             print("\n\n👋 Interrupted. Exiting...")
             break
         except Exception as e:
@@ -308,4 +414,7 @@ async def main():
 
 if __name__ == "__main__":
     # Run the async main function
-    asyncio.run(main())
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,150 @@
+# _pool.py
+from contextlib import contextmanager
+from psycopg2 import pool
+import os
+import atexit
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Upper bound on open Redshift connections
+POOL_MAX_CONN = int(os.getenv("REDSHIFT_POOL_MAX", (os.cpu_count() or 1) * 2))
+# psycopg2's pool raises PoolError when exhausted instead of waiting, so borrowers
+# queue on this semaphore for a free slot first
+_conn_slots = threading.BoundedSemaphore(POOL_MAX_CONN)
+
+# One Redshift connection pool (and SSH tunnel, when configured) per process,
+# created on first use so importing a runner never touches the network
+_tunnel = None
+_tunnel_local_port = 0
+_db_pool = None
+# Guards pool creation and tunnel restarts; re-entrant so the two can nest
+_pool_lock = threading.RLock()
+
+
+def _start_tunnel(redshift_host, redshift_port, local_port=0):
+    """
+    Start an SSH tunnel to Redshift and return it.
+    local_port=0 picks a random port; a restart passes the old port so pooled DSNs stay valid.
+    """
+    from sshtunnel import SSHTunnelForwarder
+
+    # Load SSH config
+    ssh_host = os.getenv("SSH_HOST")
+    ssh_port = int(os.getenv("SSH_PORT", 22))
+    ssh_user = os.getenv("SSH_USER")
+    ssh_private_key = os.getenv("SSH_PRIVATE_KEY_PATH")
+    ssh_password = os.getenv("SSH_PASSWORD")
+
+    if not ssh_user:
+        raise Exception("Missing one or more required environment variables for SSH or Redshift.")
+
+    tunnel = SSHTunnelForwarder(
+        (ssh_host, ssh_port),
+        ssh_username=ssh_user,
+        ssh_pkey=ssh_private_key if ssh_private_key else None,
+        ssh_password=ssh_password if ssh_password else None,
+        remote_bind_address=(redshift_host, redshift_port),
+        local_bind_address=("127.0.0.1", local_port),
+        # Keep the one long-lived transport alive and skip the agent, key
+        # directory and ssh_config lookups on every start
+        set_keepalive=30.0,
+        compression=False,
+        allow_agent=False,
+        host_pkey_directories=[],
+        ssh_config_file=None
+    )
+    tunnel.start()
+    return tunnel
+
+
+def get_pool():
+    """
+    Returns the shared Redshift connection pool, creating it on first call.
+    Connections go through an SSH tunnel when SSH_HOST is set.
+    """
+    global _tunnel, _tunnel_local_port, _db_pool
+    if _db_pool is not None:
+        return _db_pool
+    with _pool_lock:
+        if _db_pool is not None:
+            return _db_pool
+
+        # Load Redshift config
+        redshift_host = os.getenv("REDSHIFT_HOST")
+        redshift_port = int(os.getenv("REDSHIFT_PORT", 5439))
+        redshift_db = os.getenv("REDSHIFT_DBNAME")
+        redshift_user = os.getenv("REDSHIFT_USER")
+        redshift_password = os.getenv("REDSHIFT_PASSWORD")
+
+        if not all([redshift_host, redshift_db, redshift_user, redshift_password]):
+            raise Exception("Missing one or more required environment variables for SSH or Redshift.")
+
+        tunnel = None
+        host, port = redshift_host, redshift_port
+        if os.getenv("SSH_HOST"):
+            tunnel = _start_tunnel(redshift_host, redshift_port)
+            # Connect to Redshift through the local forwarded port
+            host, port = "127.0.0.1", tunnel.local_bind_port
+
+        try:
+            _db_pool = pool.ThreadedConnectionPool(
+                1, POOL_MAX_CONN,
+                host=host,
+                port=port,
+                dbname=redshift_db,
+                user=redshift_user,
+                password=redshift_password,
+                sslmode='require'
+            )
+        except Exception as e:
+            if tunnel is not None:
+                tunnel.stop()
+            raise Exception(f"Failed to connect to Redshift: {str(e)}")
+        _tunnel = tunnel
+        if tunnel is not None:
+            _tunnel_local_port = tunnel.local_bind_port
+        return _db_pool
+
+
+def _ensure_tunnel():
+    """Restart the SSH tunnel on its original local port if its transport has dropped."""
+    global _tunnel
+    if _tunnel is None or _tunnel.is_active:
+        return
+    with _pool_lock:
+        if _tunnel.is_active:
+            return
+        _tunnel.stop(force=True)
+        _tunnel = _start_tunnel(
+            os.getenv("REDSHIFT_HOST"),
+            int(os.getenv("REDSHIFT_PORT", 5439)),
+            local_port=_tunnel_local_port
+        )
+
+
+@contextmanager
+def borrow():
+    """
+    Borrows a connection from the pool for the duration of the block, waiting for
+    one to be returned when all POOL_MAX_CONN are in use.
+    The pool rolls back any open transaction on return; broken connections are discarded.
+    """
+    db_pool = get_pool()
+    _ensure_tunnel()
+    with _conn_slots:
+        conn = db_pool.getconn()
+        try:
+            yield conn
+        finally:
+            db_pool.putconn(conn, close=conn.closed != 0)
+
+
+@atexit.register
+def _close_pool():
+    """Close pooled connections and the SSH tunnel on interpreter exit."""
+    if _db_pool is not None:
+        _db_pool.closeall()
+    if _tunnel is not None:
+        _tunnel.stop()
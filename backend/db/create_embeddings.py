@@ -1,5 +1,6 @@
 import os
 import sys
+import asyncio
 from dotenv import load_dotenv
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 
@@ -7,12 +8,12 @@ from langchain_google_genai import GoogleGenerativeAIEmbeddings
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from db.table_descriptions_semantic import documents
-from db.vector_db_store import store_in_vector_db
+from db.vector_db_store import astore_in_vector_db
 
 # Load environment variables
 load_dotenv()
 
-def create_and_store_embeddings():
+async def create_and_store_embeddings():
     """
     Initializes the embedding model, loads the documents, and stores them in the vector database.
     """
@@ -24,7 +25,7 @@ def create_and_store_embeddings():
     # The `documents` are imported from the semantic descriptions file
     # `force_recreate=True` will delete any existing collection and create a new one.
     # Set to `False` if you want to load an existing store or create one if it doesn't exist.
-    vector_store = store_in_vector_db(all_splits=documents, embeddings=embeddings, force_recreate=True)
+    vector_store = await astore_in_vector_db(all_splits=documents, embeddings=embeddings, force_recreate=True)
     
     if vector_store:
         print("Successfully created and stored embeddings in the vector database.")
@@ -34,4 +35,4 @@ def create_and_store_embeddings():
 
 if __name__ == "__main__":
     # This allows the script to be run directly to populate the vector store
-    create_and_store_embeddings()
+    asyncio.run(create_and_store_embeddings())
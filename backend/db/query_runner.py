@@ -1,11 +1,16 @@
 # query_runner.py
+from __future__ import annotations
+
 from langchain_core.tools import BaseTool
 from pydantic import BaseModel, Field
-from typing import Type, Optional, Any
-import psycopg2
-import pandas as pd
+from typing import Type, Optional, Any, TYPE_CHECKING
+import asyncio
 from dotenv import load_dotenv
-import os
+
+from db._pool import borrow
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 load_dotenv()
 
@@ -26,14 +31,20 @@ class RedshiftSQLTool(BaseTool):
         run_manager: Optional[Any] = None,
     ) -> pd.DataFrame:
         """Execute the SQL query on Redshift and return DataFrame."""
+        # Imported on first query rather than at startup
+        import pandas as pd
+
         try:
-            conn = self._get_connection()
+            # Execute query and return DataFrame; building it straight from the
+            # fetched tuples skips read_sql_query's intermediate conversions
+            with borrow() as conn, conn.cursor() as cur:
+                cur.execute(sql_query)
+                if cur.description is None:
+                    return pd.DataFrame()
+                columns = [d.name for d in cur.description]
+                rows = cur.fetchall()
             
-            # Execute query and return DataFrame
-            df = pd.read_sql_query(sql_query, conn)
-            conn.close()
-            
-            return df
+            return pd.DataFrame.from_records(rows, columns=columns)
             
         except Exception as e:
             raise Exception(f"Error executing query: {str(e)}")
@@ -43,23 +54,8 @@ class RedshiftSQLTool(BaseTool):
         sql_query: str,
         run_manager: Optional[Any] = None,
     ) -> pd.DataFrame:
-        """Async version - for now just call the sync version."""
-        return self._run(sql_query, run_manager)
-    
-    def _get_connection(self):
-        """Create a connection to Redshift"""
-        try:
-            conn = psycopg2.connect(
-                host=os.getenv('REDSHIFT_HOST'),
-                port=os.getenv('REDSHIFT_PORT', 5439),
-                dbname=os.getenv('REDSHIFT_DBNAME'),
-                user=os.getenv('REDSHIFT_USER'),
-                password=os.getenv('REDSHIFT_PASSWORD'),
-                sslmode='require'
-            )
-            return conn
-        except Exception as e:
-            raise Exception(f"Failed to connect to Redshift: {str(e)}")
+        """Async version - runs the sync version in a worker thread."""
+        return await asyncio.to_thread(self._run, sql_query, run_manager)
     
     def run(self, query: str) -> pd.DataFrame:
         """Convenience method for direct execution"""
@@ -1,23 +1,55 @@
 import re
+import functools
 from langchain_core.tools import tool
-DENY_RE = re.compile(r"\b(INSERT|UPDATE|DELETE|ALTER|DROP|CREATE|REPLACE|TRUNCATE)\b", re.I)
-HAS_LIMIT_TAIL_RE = re.compile(r"(?is)\blimit\b\s+\d+(\s*,\s*\d+)?\s*;?\s*$")
 
-def _safe_sql(q: str) -> str:
+# Use RE2's linear-time matcher when google-re2 is installed; both patterns
+# stay within the syntax RE2 and re share (inline flags only)
+try:
+    import re2 as _re_engine
+except ImportError:
+    _re_engine = re
+
+DENY_RE = _re_engine.compile(r"(?i)\b(INSERT|UPDATE|DELETE|ALTER|DROP|CREATE|REPLACE|TRUNCATE)\b")
+SELECT_HEAD_RE = _re_engine.compile(r"(?i)\A\s*select\b")
+HAS_LIMIT_TAIL_RE = _re_engine.compile(r"(?is)\blimit\b\s+\d+(\s*,\s*\d+)?\s*;?\s*$")
+
+def _check_select(q: str):
+    """Normalize q and apply the read-only gates; returns (query, error message or "")."""
     # normalize
     q = q.strip()
     # block multiple statements (allow one optional trailing ;)
-    if q.count(";") > 1 or (q.endswith(";") and ";" in q[:-1]):
-        return "Error: multiple statements are not allowed."
+    # (a single find over all but the last char settles the common no-";" case)
+    if q.find(";", 0, len(q) - 1) != -1:
+        return q, "Error: multiple statements are not allowed."
     q = q.rstrip(";").strip()
 
-    # read-only gate
-    if not q.lower().startswith("select"):
-        return "Error: only SELECT statements are allowed."
+    # read-only gate (anchored match: no lowercased copy of the whole query)
+    if not SELECT_HEAD_RE.match(q):
+        return q, "Error: only SELECT statements are allowed."
     if DENY_RE.search(q):
-        return "Error: DML/DDL detected. Only read-only queries are permitted."
+        return q, "Error: DML/DDL detected. Only read-only queries are permitted."
+    return q, ""
+
+# Agent retries and repeated prompts validate the same SQL text again
+@functools.lru_cache(maxsize=1024)
+def _safe_sql(q: str) -> str:
+    q, error = _check_select(q)
+    if error:
+        return error
 
     # append LIMIT only if not already present at the end (robust to whitespace/newlines)
     if not HAS_LIMIT_TAIL_RE.search(q):
         q += " LIMIT 5"
-    return q
\ No newline at end of file
+    return q
+
+@functools.lru_cache(maxsize=1024)
+def _preview_sql(q: str, max_rows: int) -> str:
+    """
+    Validate q like _safe_sql, then wrap it so Redshift returns at most max_rows rows
+    whatever the query's own LIMIT/OFFSET/FETCH clause says.
+    """
+    q, error = _check_select(q)
+    if error:
+        return error
+    # Newline before ")" so a trailing -- comment can't swallow the wrapper
+    return f"SELECT * FROM (\n{q}\n) AS _preview LIMIT {max_rows}"
@@ -1,3 +1,5 @@
+from itertools import groupby
+from operator import itemgetter
 from vector_db_store import get_db_connection, release_db_connection, COLLECTION_NAME
 
 def debug_vector_store():
@@ -7,33 +9,30 @@ def debug_vector_store():
         print(f"Looking for collection: {COLLECTION_NAME}")
         print(f"Expected table name: langchain_pg_collection_{COLLECTION_NAME}")
         
-        # Check all tables in public schema
+        # Check langchain and embedding tables with one query, tagged by match
         with conn.cursor() as cur:
             cur.execute("""
-                SELECT tablename 
-                FROM pg_tables 
-                WHERE schemaname = 'public' 
+                SELECT 'langchain' AS tag, tablename
+                FROM pg_tables
+                WHERE schemaname = 'public'
                 AND tablename LIKE '%langchain%'
-                ORDER BY tablename;
-            """)
-            tables = cur.fetchall()
-            print(f"\nFound {len(tables)} langchain-related tables:")
-            for table in tables:
-                print(f"  - {table[0]}")
-        
-        # Check if embedding table exists
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT tablename 
-                FROM pg_tables 
-                WHERE schemaname = 'public' 
+                UNION ALL
+                SELECT 'embedding', tablename
+                FROM pg_tables
+                WHERE schemaname = 'public'
                 AND tablename LIKE '%embedding%'
-                ORDER BY tablename;
+                ORDER BY 1, 2;
             """)
-            tables = cur.fetchall()
-            print(f"\nFound {len(tables)} embedding-related tables:")
+            grouped = {
+                tag: [row[1] for row in rows]
+                for tag, rows in groupby(cur.fetchall(), key=itemgetter(0))
+            }
+        
+        for tag in ("langchain", "embedding"):
+            tables = grouped.get(tag, [])
+            print(f"\nFound {len(tables)} {tag}-related tables:")
             for table in tables:
-                print(f"  - {table[0]}")
+                print(f"  - {table}")
                 
     finally:
         release_db_connection(conn)
@@ -1,21 +1,84 @@
-from langchain_postgres import PGVector
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
-import psycopg2
-from psycopg2 import pool
+from langchain_core.embeddings import Embeddings
+from cachetools import TTLCache
+from psycopg_pool import ConnectionPool
+from psycopg.types.json import Json, Jsonb
 import os
+import asyncio
+import hashlib
+import threading
+import time
+import uuid
+import orjson
 from dotenv import load_dotenv
-import google.generativeai as genai
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
 
 load_dotenv()
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-genai.configure(api_key=GOOGLE_API_KEY)
 
 COLLECTION_NAME = os.getenv("COLLECTION_NAME")
 PGVECTOR_CONNECTION_STRING = os.getenv("PGVECTOR_CONNECTION_STRING")
 CONNECTION_STRING = os.getenv("CONNECTION_STRING")
 
-# Create a connection pool
-db_pool = pool.SimpleConnectionPool(1, 10, dsn=CONNECTION_STRING)
+# Number of documents sent per embedding request
+EMBEDDING_BATCH_SIZE = 100
+# Dimension of models/embedding-001 vectors; a typed column is what lets pgvector index it
+EMBEDDING_DIMENSION = 768
+# HNSW graph parameters for the embedding index
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+# Embedding requests in flight at once, kept under the API's rate limit
+EMBEDDING_CONCURRENCY = 16
+
+# Create a connection pool (psycopg 3, the same driver langchain_postgres uses).
+# Autocommit so plain reads don't leave connections INTRANS on return; multi-statement
+# work opens conn.transaction() explicitly
+db_pool = ConnectionPool(CONNECTION_STRING, min_size=1, max_size=10, open=True, kwargs={"autocommit": True})
+
+# Seconds between reads of the collection's contents stamp from the database
+STORE_VERSION_CHECK_SECONDS = 30
+
+# Last contents stamp read for the collection; a rebuild writes a new one, so cached
+# search results keyed by it are discarded, including in other processes
+_store_version = None
+_store_version_checked_at = float("-inf")
+_store_version_lock = threading.Lock()
+
+# Collections confirmed to exist; a collection only disappears via delete_vector_store
+_existing_collections = set()
+_existing_collections_lock = threading.Lock()
+
+def get_store_version():
+    """
+    Returns the stamp copy_embeddings stored with the collection's contents, or None.
+    The stamp lives in langchain_pg_collection.cmetadata, so a rebuild by another
+    process (e.g. db/create_embeddings.py) is seen within STORE_VERSION_CHECK_SECONDS.
+    """
+    global _store_version, _store_version_checked_at
+    if time.monotonic() - _store_version_checked_at < STORE_VERSION_CHECK_SECONDS:
+        return _store_version
+    with _store_version_lock:
+        if time.monotonic() - _store_version_checked_at < STORE_VERSION_CHECK_SECONDS:
+            return _store_version
+        conn = get_db_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT cmetadata->>'contents_version' FROM langchain_pg_collection WHERE name = %s;",
+                    (COLLECTION_NAME,)
+                )
+                row = cur.fetchone()
+            _store_version = row[0] if row else None
+        except Exception as e:
+            print(f"Could not read the vector store version, keeping the last one: {e}")
+        finally:
+            release_db_connection(conn)
+        _store_version_checked_at = time.monotonic()
+    return _store_version
+
+def _expire_store_version():
+    """Make the next get_store_version() re-read the stamp after a local rebuild."""
+    global _store_version_checked_at
+    _store_version_checked_at = float("-inf")
 
 def get_db_connection():
     """
@@ -33,7 +96,10 @@ def collection_exists(conn, collection_name):
     """
     Checks if a collection exists in the database.
     Updated to work with langchain_postgres's unified table structure.
+    A positive answer is remembered, so later calls skip the query.
     """
+    if collection_name in _existing_collections:
+        return True
     with conn.cursor() as cur:
         # Check if the collection exists as a row in langchain_pg_collection
         cur.execute("""
@@ -42,7 +108,58 @@ def collection_exists(conn, collection_name):
                 WHERE name = %s
             );
         """, (collection_name,))
-        return cur.fetchone()[0]
+        exists = cur.fetchone()[0]
+    if exists:
+        with _existing_collections_lock:
+            _existing_collections.add(collection_name)
+    return exists
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Wraps an embeddings model and caches query vectors by a hash of the
+    whitespace-normalized text, so repeated questions skip the embedding API.
+    Document embedding is passed through uncached.
+    """
+
+    def __init__(self, embeddings, maxsize=1024, ttl=3600):
+        self.embeddings = embeddings
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(text):
+        return hashlib.sha256(" ".join(text.split()).encode()).hexdigest()
+
+    def _get(self, key):
+        with self._lock:
+            return self._cache.get(key)
+
+    def _put(self, key, vector):
+        with self._lock:
+            self._cache[key] = vector
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts):
+        return await self.embeddings.aembed_documents(texts)
+
+    def embed_query(self, text):
+        key = self._key(text)
+        vector = self._get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self._put(key, vector)
+        return vector
+
+    async def aembed_query(self, text):
+        key = self._key(text)
+        vector = self._get(key)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            self._put(key, vector)
+        return vector
 
 
 def get_vector_store(embeddings=None):
@@ -50,46 +167,185 @@ def get_vector_store(embeddings=None):
     Retrieves the vector store. If the collection exists, it loads it. 
     Otherwise, it returns None.
     """
+    from langchain_postgres import PGVector
+
     conn = get_db_connection()
     try:
         if collection_exists(conn, COLLECTION_NAME):
             if embeddings is None:
                 embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
+            if not isinstance(embeddings, CachedQueryEmbeddings):
+                embeddings = CachedQueryEmbeddings(embeddings)
             return PGVector(
                 collection_name=COLLECTION_NAME,
                 connection=PGVECTOR_CONNECTION_STRING,
                 embeddings=embeddings,
+                embedding_length=EMBEDDING_DIMENSION,
             )
         else:
             return None
     finally:
         release_db_connection(conn)
 
-def create_vector_store(all_splits, embeddings):
+def _is_rate_limited(error):
+    """
+    Returns True for quota errors (HTTP 429 / RESOURCE_EXHAUSTED) from the embedding API.
+    """
+    message = str(error)
+    return "429" in message or "RESOURCE_EXHAUSTED" in message.upper()
+
+@retry(
+    retry=retry_if_exception(_is_rate_limited),
+    wait=wait_exponential(multiplier=1, min=2, max=60),
+    stop=stop_after_attempt(6),
+    reraise=True,
+)
+async def _aembed_batch(embeddings, texts):
+    """
+    Embeds one batch of texts, backing off exponentially when rate limited.
+    """
+    return await embeddings.aembed_documents(texts)
+
+async def aembed_documents_in_batches(all_splits, embeddings, batch_size=EMBEDDING_BATCH_SIZE,
+                                      concurrency=EMBEDDING_CONCURRENCY):
+    """
+    Embeds the documents with one request per batch, up to `concurrency` batches in flight,
+    and returns (text, vector) pairs in document order.
+    """
+    texts = [doc.page_content for doc in all_splits]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def embed_one(batch):
+        async with semaphore:
+            return await _aembed_batch(embeddings, batch)
+
+    batches = await asyncio.gather(*(
+        embed_one(texts[start:start + batch_size])
+        for start in range(0, len(texts), batch_size)
+    ))
+    vectors = [vector for batch in batches for vector in batch]
+    return list(zip(texts, vectors))
+
+def copy_embeddings(collection_name, text_embeddings, metadatas):
+    """
+    Bulk-loads precomputed (text, vector) pairs into langchain_pg_embedding with COPY,
+    which skips the per-row INSERT parsing and planning of PGVector.add_embeddings.
+    A new contents stamp is written to the collection row in the same transaction.
+    """
+    conn = get_db_connection()
+    try:
+        with conn.transaction(), conn.cursor() as cur:
+            cur.execute(
+                "SELECT uuid, cmetadata FROM langchain_pg_collection WHERE name = %s;",
+                (collection_name,)
+            )
+            collection_id, cmetadata = cur.fetchone()
+            with cur.copy(
+                "COPY langchain_pg_embedding (id, collection_id, embedding, document, cmetadata) FROM STDIN"
+            ) as copy:
+                for (text, vector), metadata in zip(text_embeddings, metadatas):
+                    copy.write_row((
+                        str(uuid.uuid4()),
+                        collection_id,
+                        # pgvector's text input format: [x1,x2,...]
+                        orjson.dumps(vector).decode(),
+                        text,
+                        Jsonb(metadata),
+                    ))
+            # cmetadata is a json (not jsonb) column
+            cmetadata = dict(cmetadata or {}, contents_version=uuid.uuid4().hex)
+            cur.execute(
+                "UPDATE langchain_pg_collection SET cmetadata = %s WHERE uuid = %s;",
+                (Json(cmetadata), collection_id)
+            )
+    finally:
+        release_db_connection(conn)
+
+async def acreate_vector_store(all_splits, embeddings):
     """
     Creates a new vector store.
+    Embeddings are computed up front in batches and COPY'd into the existing tables;
+    PGVector itself only creates the tables and the collection row.
+    The blocking database steps run on threads, so this is safe to await from a running loop.
     """
-    vector_store = PGVector.from_documents(
-        documents=all_splits,
-        embedding=embeddings,
+    from langchain_postgres import PGVector
+
+    vector_store = await asyncio.to_thread(
+        PGVector,
         collection_name=COLLECTION_NAME,
         connection=PGVECTOR_CONNECTION_STRING,
+        embeddings=embeddings,
+        embedding_length=EMBEDDING_DIMENSION,
+        pre_delete_collection=False,
     )
+    text_embeddings = await aembed_documents_in_batches(all_splits, embeddings)
+    await asyncio.to_thread(
+        copy_embeddings,
+        COLLECTION_NAME,
+        text_embeddings,
+        [doc.metadata for doc in all_splits],
+    )
+    await asyncio.to_thread(create_hnsw_index)
+    _expire_store_version()
     return vector_store
 
+def create_hnsw_index():
+    """
+    Builds an HNSW index for cosine search (PGVector's default distance) on the
+    embedding column, so similarity search stops scanning every row.
+    Best effort: tables created before the column was typed, or a pgvector older
+    than 0.5, cannot take it, and search falls back to an exact scan.
+    """
+    conn = get_db_connection()
+    try:
+        with conn.transaction(), conn.cursor() as cur:
+            cur.execute(f"""
+                CREATE INDEX IF NOT EXISTS langchain_pg_embedding_hnsw_idx
+                ON langchain_pg_embedding
+                USING hnsw (embedding vector_cosine_ops)
+                WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION});
+            """)
+    except Exception as e:
+        print(f"Could not create HNSW index, similarity search will use an exact scan: {e}")
+    finally:
+        release_db_connection(conn)
+
 def delete_vector_store():
     """
     Deletes the vector store collection.
+    langchain_postgres keeps every collection in shared tables, so this deletes the
+    collection's rows and leaves the tables and their indexes in place.
+    The name is passed as a transaction-local setting since DO blocks take no parameters;
+    both statements are pipelined so they still cost a single round trip.
     """
+    with _existing_collections_lock:
+        _existing_collections.discard(COLLECTION_NAME)
     conn = get_db_connection()
     try:
-        with conn.cursor() as cur:
-            cur.execute(f"DROP TABLE IF EXISTS langchain_pg_collection_{COLLECTION_NAME};")
-            conn.commit()
+        with conn.transaction(), conn.pipeline(), conn.cursor() as cur:
+            cur.execute(
+                "SELECT set_config('vector_store.collection_name', %s, true);",
+                (COLLECTION_NAME,)
+            )
+            cur.execute("""
+                DO $$
+                BEGIN
+                    IF to_regclass('langchain_pg_collection') IS NOT NULL THEN
+                        DELETE FROM langchain_pg_embedding
+                        WHERE collection_id = (
+                            SELECT uuid FROM langchain_pg_collection
+                            WHERE name = current_setting('vector_store.collection_name')
+                        );
+                        DELETE FROM langchain_pg_collection
+                        WHERE name = current_setting('vector_store.collection_name');
+                    END IF;
+                END $$;
+            """)
     finally:
         release_db_connection(conn)
+    _expire_store_version()
 
-def store_in_vector_db(all_splits, embeddings, force_recreate=False):
+async def astore_in_vector_db(all_splits, embeddings, force_recreate=False):
     """
     Stores documents in the vector store.
     If force_recreate is True, the existing vector store will be deleted and a new one will be created.
@@ -97,13 +353,13 @@ def store_in_vector_db(all_splits, embeddings, force_recreate=False):
     """
     if force_recreate:
         print("Force recreating the vector store.")
-        delete_vector_store()
-        return create_vector_store(all_splits, embeddings)
+        await asyncio.to_thread(delete_vector_store)
+        return await acreate_vector_store(all_splits, embeddings)
     
-    vector_store = get_vector_store(embeddings)
+    vector_store = await asyncio.to_thread(get_vector_store, embeddings)
     if vector_store:
         print("Loading existing vector store.")
         return vector_store
     else:
         print("Creating a new vector store.")
-        return create_vector_store(all_splits, embeddings)
\ No newline at end of file
+        return await acreate_vector_store(all_splits, embeddings)
\ No newline at end of file
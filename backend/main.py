@@ -1,20 +1,21 @@
 import os
 import sys
 import logging
-import json
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
 from typing import Optional, Dict, Any, List
 
 # Add parent directory to path to maintain your import structure
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, HTTPException, Response, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
-import google.generativeai as genai
+import orjson
+from cachetools import TTLCache
 
 # Relative imports from your project structure
 try:
@@ -39,8 +40,9 @@ load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 if not GOOGLE_API_KEY:
     logger.error("GOOGLE_API_KEY not found in environment variables")
-else:
-    genai.configure(api_key=GOOGLE_API_KEY)
+
+# Threads for blocking agent work (Redshift queries, vector search, sync graph nodes)
+AGENT_THREAD_WORKERS = int(os.getenv("AGENT_THREAD_WORKERS", 8))
 
 # --- Pydantic Models ---
 
@@ -68,6 +70,28 @@ class ChatResponse(BaseModel):
     error: Optional[str] = None
     record_count: int = 0
 
+# --- Result Post-processing ---
+
+def _postprocess(execution_data_str: str) -> List[Dict[str, Any]]:
+    """
+    Parse the agent's execution_data_json into a list of records.
+    """
+    try:
+        parsed = orjson.loads(execution_data_str)
+    except orjson.JSONDecodeError as e:
+        logger.warning("Failed to parse execution_data_json: %s", e)
+        return []
+    # Ensure data_content is ALWAYS a list
+    if isinstance(parsed, list):
+        return parsed
+    if isinstance(parsed, dict):
+        # Handle error dict or single record
+        if "error" in parsed:
+            logger.warning("Query returned error: %s", parsed.get('error'))
+            return []
+        return [parsed]
+    return []
+
 # --- Chatbot Service Logic ---
 
 class ChatbotService:
@@ -75,11 +99,20 @@ class ChatbotService:
         self.vector_store = None
         self.query_runner = None
         self.gemini_agent = None
+        # Successful first-turn answers keyed by normalized question, kept briefly so a
+        # repeated opening question skips the agent, Redshift and Gemini entirely.
+        # Only touched on the event loop with no await in between, so no lock is needed
+        self._resp_cache = TTLCache(maxsize=1024, ttl=120)
         self._init_agent_components()
     
     def _init_agent_components(self):
         """Initialize agent components once during startup"""
         logger.info("Initializing Gemini SQL Agent components...")
+
+        # Configured here, once per service, instead of on module import
+        if GOOGLE_API_KEY:
+            import google.generativeai as genai
+            genai.configure(api_key=GOOGLE_API_KEY)
         
         # Load existing vector store
         try:
@@ -89,7 +122,7 @@ class ChatbotService:
             else:
                 logger.warning("⚠ Warning: No existing vector store found.")
         except Exception as e:
-            logger.error(f"✗ Error loading vector store: {e}")
+            logger.error("✗ Error loading vector store: %s", e)
             self.vector_store = None
         
         # Initialize Query Runner
@@ -97,7 +130,7 @@ class ChatbotService:
             self.query_runner = RedshiftSQLTool()
             logger.info("✓ Redshift query runner initialized.")
         except Exception as e:
-            logger.error(f"⚠ Could not initialize Redshift query runner: {e}")
+            logger.error("⚠ Could not initialize Redshift query runner: %s", e)
             self.query_runner = None
         
         # Initialize the Gemini Agent
@@ -111,7 +144,7 @@ class ChatbotService:
                 )
                 logger.info("✓ Gemini SQL LangGraph Agent initialized successfully.")
             except Exception as e:
-                logger.error(f"✗ Error initializing Gemini agent: {e}")
+                logger.error("✗ Error initializing Gemini agent: %s", e)
                 self.gemini_agent = None
         else:
             logger.error("✗ Cannot initialize agent without vector store.")
@@ -126,11 +159,25 @@ class ChatbotService:
         if not self.vector_store:
             return {"error": "No existing vector store found."}
 
-        logger.info(f"Processing query for thread: {thread_id} | Q: {user_question}")
+        cache_key = user_question.strip().lower()
 
         try:
+            # Follow-ups are rewritten against the thread's history, so only questions
+            # opening a thread have an answer that depends on the text alone
+            first_turn = not await self.gemini_agent.has_history(thread_id)
+            cached = self._resp_cache.get(cache_key) if first_turn else None
+            if cached is not None:
+                logger.info("Cache hit for thread: %s | Q: %s", thread_id, user_question)
+                # Keep the thread's history complete for the follow-ups that come next
+                await self.gemini_agent.record_turn(user_question, cached, thread_id=thread_id)
+                return {**cached, "cache_hit": True}
+
+            logger.info("Processing query for thread: %s | Q: %s", thread_id, user_question)
+
             # Process the user question
-            result = self.gemini_agent.process_query(user_question, thread_id=thread_id)
+            result = await self.gemini_agent.process_query(user_question, thread_id=thread_id)
+            if first_turn and result.get("success") and not result.get("error"):
+                self._resp_cache[cache_key] = result
             return result
         except Exception as e:
             logger.exception("Error occurred during query processing")
@@ -145,16 +192,24 @@ chatbot_service: Optional[ChatbotService] = None
 async def lifespan(app: FastAPI):
     # Startup: Initialize the Chatbot Service
     global chatbot_service
+    # asyncio.to_thread and LangGraph's sync nodes run on the loop's default
+    # executor; bound it. Queries beyond the Redshift pool size wait in
+    # db._pool.borrow() for a free connection rather than failing
+    executor = ThreadPoolExecutor(max_workers=AGENT_THREAD_WORKERS, thread_name_prefix="agent")
+    asyncio.get_running_loop().set_default_executor(executor)
     chatbot_service = ChatbotService()
     yield
     # Shutdown: Clean up if necessary (e.g., close DB connections)
     logger.info("Shutting down SQL Chatbot API")
+    executor.shutdown(wait=False)
 
 app = FastAPI(
     title="SQL RAG Chatbot API",
     description="API for converting natural language to Redshift SQL queries with visualization suggestions.",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    # Row payloads can be large; orjson serializes them far faster than the stdlib encoder
+    default_response_class=ORJSONResponse
 )
 
 # CORS Configuration (Adjust origins for production)
@@ -181,12 +236,12 @@ async def health_check():
     }
     
     if not status_report["agent_ready"]:
-        return JSONResponse(status_code=503, content=status_report)
+        return ORJSONResponse(status_code=503, content=status_report)
         
     return status_report
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest):
+@app.post("/chat", response_model=ChatResponse, response_class=ORJSONResponse)
+async def chat_endpoint(request: ChatRequest, response: Response):
     """
     Main chat endpoint.
     Receives a natural language question and returns SQL data + chart config.
@@ -199,6 +254,7 @@ async def chat_endpoint(request: ChatRequest):
 
     # Get raw response from agent
     raw_result = await chatbot_service.get_response(request.question, request.thread_id)
+    response.headers["X-Cache"] = "hit" if raw_result.get("cache_hit") else "miss"
     
     # Handle Errors from the agent
     if raw_result.get("error") or not raw_result.get("success", True):
@@ -211,35 +267,18 @@ async def chat_endpoint(request: ChatRequest):
         )
 
     # Parse JSON data string to Python Object
-    data_content = []
     execution_data_str = raw_result.get("execution_data_json", "[]")
-    try:
-        parsed = json.loads(execution_data_str)
-        # Ensure data_content is ALWAYS a list
-        if isinstance(parsed, list):
-            data_content = parsed
-        elif isinstance(parsed, dict):
-            # Handle error dict or single record
-            if "error" in parsed:
-                logger.warning(f"Query returned error: {parsed.get('error')}")
-                data_content = []
-            else:
-                data_content = [parsed]
-        else:
-            data_content = []
-    except json.JSONDecodeError as e:
-        logger.warning(f"Failed to parse execution_data_json: {e}")
-        data_content = []
+    data_content = _postprocess(execution_data_str)
 
     # Map raw result to Pydantic Response
-    response = ChatResponse(
+    chat_response = ChatResponse(
         sql_query=raw_result.get("cleaned_sql_query", ""),
         data=data_content,
         record_count=len(data_content),
         chart_analysis=raw_result.get("chart_analysis", {"chartable": False, "reasoning": "No analysis available"})
     )
     
-    return response
+    return chat_response
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,5 +1,13 @@
 import re
 
+# Compiled once at import; extract_sql_query runs on every LLM response
+_HEADER = re.compile(r"(?i)^(sql|generated sql query|query output|here is your sql):?\s*")
+# Literal prefixes of _HEADER's alternatives, checked before running the regex
+_HEADER_PREFIXES = ("sql", "generated sql query", "query output", "here is your sql")
+# A -- comment up to end of line, but only where the -- sits outside a '...' literal
+_INLINE_COMMENT = re.compile(r"(?m)^((?:[^'\n]|'[^'\n]*')*?)--.*$")
+_BLOCK_COMMENT = re.compile(r"/\*.*?\*/", re.DOTALL)
+
 def extract_sql_query(llm_output: str, strip_comments: bool = False) -> str:
     """
     Extracts the raw SQL query from LLM output.
@@ -12,37 +20,43 @@ def extract_sql_query(llm_output: str, strip_comments: bool = False) -> str:
     Returns:
         str: The cleaned SQL query.
     """
-    # Decode escaped characters if they exist (e.g., "\\n" → "\n")
-    try:
-        if "\\n" in llm_output or "\\t" in llm_output:
-            llm_output = bytes(llm_output, "utf-8").decode("unicode_escape")
-    except Exception:
-        pass  # Don't break if decoding fails
-
-    # Remove markdown-style code fences if they slipped in
-    llm_output = re.sub(r"(?i)^```sql\s*", "", llm_output.strip())
-    llm_output = re.sub(r"(?i)```$", "", llm_output.strip())
-
-    # Remove generic headers (if present)
-    llm_output = re.sub(
-        r"(?i)^(sql|generated sql query|query output|here is your sql):?\s*",
-        "",
-        llm_output.strip()
-    )
+    # Decode escaped characters if they exist (e.g., "\\n" → "\n").
+    # One scan for a backslash settles the common case; latin-1 + backslashreplace
+    # turns non-Latin-1 characters into \uXXXX escapes that unicode_escape restores,
+    # so accented identifiers survive instead of becoming mojibake.
+    if "\\" in llm_output and ("\\n" in llm_output or "\\t" in llm_output):
+        try:
+            llm_output = llm_output.encode("latin-1", "backslashreplace").decode("unicode_escape")
+        except UnicodeDecodeError:
+            pass  # Don't break if decoding fails
+
+    # Strip once up front; the final strip() tidies whatever the removals leave behind
+    llm_output = llm_output.strip()
+
+    # Remove markdown-style code fences if they slipped in (fixed anchors, no regex needed)
+    if llm_output[:6].lower() == "```sql":
+        llm_output = llm_output[6:].lstrip()
+    llm_output = llm_output.removesuffix("```")
+
+    # Remove generic headers (if present); most outputs start straight with SQL,
+    # so a prefix check on the first few characters skips the regex
+    if llm_output[:20].lower().startswith(_HEADER_PREFIXES):
+        llm_output = _HEADER.sub("", llm_output)
 
     # Remove lines that are purely comments, if enabled
     if strip_comments:
-        # Remove single-line comments starting with --
-        llm_output = re.sub(r"(?m)^\s*--.*$", "", llm_output)
-        
-        # Optionally remove inline -- comments
-        llm_output = re.sub(r"--.*", "", llm_output)
+        # Remove -- comments (whole-line and inline) in one pass; text before them is kept
+        inline_count = block_count = 0
+        if "--" in llm_output:
+            llm_output, inline_count = _INLINE_COMMENT.subn(r"\1", llm_output)
 
         # Optionally remove multi-line /* */ comments
-        llm_output = re.sub(r"/\*.*?\*/", "", llm_output, flags=re.DOTALL)
+        if "/*" in llm_output:
+            llm_output, block_count = _BLOCK_COMMENT.subn("", llm_output)
 
-        # Clean up extra blank lines
-        lines = llm_output.splitlines()
-        llm_output = "\n".join(line for line in lines if line.strip())
+        # Clean up the blank lines removed comments leave behind (nothing to do if none matched)
+        if inline_count + block_count:
+            lines = llm_output.splitlines()
+            llm_output = "\n".join(line for line in lines if line.strip())
         
     return llm_output.strip()